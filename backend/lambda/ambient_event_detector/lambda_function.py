@@ -24,29 +24,129 @@ EXAMPLES OF WHAT CLAUDE GENERATES:
 - Timer about to expire → Live Activity update
 """
 
+import asyncio
+import hashlib
 import json
 import os
 import logging
+import threading
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
 from uuid import uuid4
+import httpx
 import pymysql
-from anthropic import Anthropic
-
-# Configure logging
+from pymysql.constants import FIELD_TYPE
+from anthropic import APIStatusError, AsyncAnthropic
+
+# orjson is ~3-10x faster than stdlib json on the dicts we serialize into
+# prompts and DB rows; fall back to stdlib if the layer doesn't bundle it
+try:
+    import orjson
+
+    def jdumps(obj, indent=False):
+        """Serialize obj to a JSON string"""
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, option=option).decode()
+
+    jloads = orjson.loads
+except ImportError:
+    def jdumps(obj, indent=False):
+        """Serialize obj to a JSON string"""
+        return json.dumps(obj, indent=2 if indent else None)
+
+    jloads = json.loads
+
+# ambient_events.data is a native JSON column; decoding it in the driver
+# hands rows back with the field already a dict, removing the per-row
+# json.loads from the hot loop
+_CONVERSIONS = dict(pymysql.converters.conversions)
+_CONVERSIONS[FIELD_TYPE.JSON] = jloads
+
+# Configure logging (WARNING in production: the per-user INFO lines cost
+# string formatting and CloudWatch ingestion for no operational value)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
 # Environment variables
 DB_HOST = os.environ['DB_HOST']
 DB_PORT = int(os.environ.get('DB_PORT', 3306))
 DB_NAME = os.environ['DB_NAME']
 DB_USER = os.environ['DB_USER']
-DB_PASSWORD = os.environ['DB_PASSWORD']
+DB_PASSWORD = os.environ.get('DB_PASSWORD', '')
 CLAUDE_API_KEY = os.environ['CLAUDE_API_KEY']
 
+# RDS Proxy support: point DB_HOST at the proxy endpoint and set
+# DB_USE_IAM_AUTH=true to authenticate with short-lived IAM tokens instead
+# of a static password (requires TLS, so set DB_SSL_CA to the RDS CA bundle)
+DB_USE_IAM_AUTH = os.environ.get('DB_USE_IAM_AUTH', 'false').lower() == 'true'
+DB_SSL_CA = os.environ.get('DB_SSL_CA')  # e.g. /opt/rds-ca.pem
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-2')
+
 # Claude configuration
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
 MAX_USERS_PER_RUN = 50
+MAX_CONCURRENT_USERS = 10  # Cap concurrent Claude calls (rate limits + DB pressure)
+RESPONSE_CACHE_TTL_MINUTES = 5  # How long a cached Claude response stays valid
+
+# Message Batches API mode: 50% cost and a separate rate-limit pool, at the
+# price of results landing on a later tick instead of inline
+USE_BATCH_API = os.environ.get('CLAUDE_USE_BATCHES', 'false').lower() == 'true'
+BATCH_SOURCE = 'ambient_event_detector'
+
+# Module-level client so warm Lambda containers reuse the HTTP session.
+# HTTP/2 multiplexes all concurrent detection calls over one TCP+TLS
+# connection — in a VPC Lambda each extra handshake is ~200ms, so without
+# it a 10-wide fan-out opens 10 connections on a cold pool
+anthropic_client = AsyncAnthropic(
+    api_key=CLAUDE_API_KEY,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+    )
+)
+
+# Persistent event loop in a daemon thread: the shared client's HTTP pool is
+# bound to the loop it first runs on, so priming at container init and every
+# later invocation must use the same loop (asyncio.run would tear it down)
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, daemon=True).start()
+
+
+def run_async(coro):
+    """Run a coroutine on the persistent event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+# Module-level DB connection, reused across warm invocations (avoids paying
+# TCP + TLS + MySQL auth on every 60s tick and keeps RDS connection count flat)
+_connection = None
+
+# Cached IAM auth token (tokens live 15 minutes; refresh at 14)
+_iam_token = None
+_iam_token_expires = None
+
+
+def get_db_password():
+    """
+    Resolve the DB credential: the static password normally, or a generated
+    IAM auth token when connecting through RDS Proxy with IAM auth
+    """
+    global _iam_token, _iam_token_expires
+
+    if not DB_USE_IAM_AUTH:
+        return DB_PASSWORD
+
+    now = datetime.now()
+    if _iam_token is None or now >= _iam_token_expires:
+        import boto3
+        _iam_token = boto3.client('rds', region_name=AWS_REGION).generate_db_auth_token(
+            DBHostname=DB_HOST,
+            Port=DB_PORT,
+            DBUsername=DB_USER
+        )
+        _iam_token_expires = now + timedelta(minutes=14)
+
+    return _iam_token
 
 # Ambient Intelligence System Prompt for Event Detection
 AMBIENT_EVENT_DETECTOR_PROMPT = """You are Ambia's ambient event detector - an AI that identifies time-sensitive moments in a user's life.
@@ -61,11 +161,13 @@ CORE PRINCIPLE:
 Information should appear EXACTLY when it's needed, without the user asking.
 
 USER CONTEXT PROVIDED:
-- Current time and date
-- Recent activity patterns
-- Calendar events (if available)
-- Location context (if available)
-- Recent queries and interactions
+Compact JSON with abbreviated keys (to keep prompts small):
+- t: current time (unix seconds)
+- dow: day of week
+- tod: time of day (morning/afternoon/evening/night)
+- rq: recent queries, each {q: query text, ts: unix seconds}
+- tp: activity counts per time of day
+- ae: currently active ambient events, each {id, type, title, data}
 
 RESPONSE FORMAT (return ONLY valid JSON):
 {
@@ -100,6 +202,83 @@ IMPORTANT:
 - NO HARDCODING - You can create events for ANY service, ANY type of activity
 """
 
+# Static system block with prompt caching: the detector prompt is identical on
+# every call, so Anthropic caches the prefix server-side (~5 min TTL — always
+# warm at a 1-minute tick) and only the per-user context is billed at full rate
+SYSTEM_BLOCKS = [{
+    "type": "text",
+    "text": AMBIENT_EVENT_DETECTOR_PROMPT,
+    "cache_control": {"type": "ephemeral"}
+}]
+PROMPT_CACHING_HEADERS = {"anthropic-beta": "prompt-caching-2024-07-31"}
+
+# Forced tool schema: Claude must answer through this tool, so the response
+# arrives as a structured dict instead of free text that may fail json.loads
+EMIT_EVENTS_TOOL = {
+    "name": "emit_events",
+    "description": "Report the time-sensitive ambient events detected in the "
+                   "user's context. Pass an empty events list if nothing is "
+                   "time-sensitive right now.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "events": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "event_type": {
+                            "type": "string",
+                            "enum": ["live_activity", "dynamic_island", "notification"]
+                        },
+                        "priority": {
+                            "type": "string",
+                            "enum": ["critical", "high", "medium", "low"]
+                        },
+                        "title": {"type": "string"},
+                        "subtitle": {"type": "string"},
+                        "body": {"type": "string"},
+                        "data": {"type": "object"},
+                        "icon": {"type": "string"},
+                        "color": {"type": "string"},
+                        "start_time": {"type": "string"},
+                        "end_time": {"type": "string"},
+                        "confidence_score": {"type": "number"}
+                    },
+                    "required": ["event_type", "priority", "title"]
+                }
+            }
+        },
+        "required": ["events"]
+    }
+}
+EMIT_EVENTS_TOOL_CHOICE = {"type": "tool", "name": "emit_events"}
+
+
+async def _prime_claude():
+    """
+    One-token Claude call made at container init: it performs the TLS/HTTP
+    handshake for the shared pool AND populates the prompt cache, so the
+    first real detection call skips both. Costs ~1 token per cold start.
+    """
+    try:
+        await anthropic_client.messages.create(
+            model=CLAUDE_MODEL,
+            max_tokens=1,
+            system=SYSTEM_BLOCKS,
+            messages=[{"role": "user", "content": "."}],
+            extra_headers=PROMPT_CACHING_HEADERS
+        )
+        logger.info("Claude warm-up call completed")
+    except Exception as e:
+        # Warm-up is best-effort; the first real call just pays the setup
+        logger.warning(f"Claude warm-up call failed: {str(e)}")
+
+
+# Fire the warm-up concurrently with the rest of container init (module
+# import, first DB connect) — nothing waits on it
+_prime_future = asyncio.run_coroutine_threadsafe(_prime_claude(), _loop)
+
 
 def lambda_handler(event, context):
     """
@@ -114,8 +293,13 @@ def lambda_handler(event, context):
         connection = get_db_connection()
         logger.info("Database connected successfully")
 
+        # One timestamp per invocation, bound into queries as a parameter:
+        # identical statement text enables plan reuse, and every row written
+        # this tick carries the same created_at
+        now = datetime.now()
+
         # Get active users (have device tokens and notifications enabled)
-        users = get_active_users(connection)
+        users = get_active_users(connection, now)
         logger.info(f"Found {len(users)} active users")
 
         if not users:
@@ -129,49 +313,17 @@ def lambda_handler(event, context):
                 })
             }
 
-        users_processed = 0
-        events_generated = 0
-        errors = 0
-
-        # Process each user
-        for user in users:
-            user_id = user['user_id']
-            device_token = user['device_token']
-
-            logger.info(f"Processing user {user_id}")
-
-            try:
-                # Get user context
-                user_context = get_user_context(connection, user_id)
-
-                # Call Claude to detect ambient events
-                detected_events = detect_ambient_events_with_claude(
-                    user_id=user_id,
-                    user_context=user_context
-                )
-
-                if detected_events and len(detected_events) > 0:
-                    # Store events in ambient_events table
-                    for event_data in detected_events:
-                        event_id = store_ambient_event(
-                            connection=connection,
-                            user_id=user_id,
-                            event_data=event_data
-                        )
-
-                        if event_id:
-                            events_generated += 1
-                            logger.info(f"Generated event {event_id}: {event_data['title']}")
-
-                            # TODO: Trigger push notification if event_type is 'notification'
-                            # This would use APNs (Apple Push Notification service)
-
-                users_processed += 1
-
-            except Exception as e:
-                logger.error(f"Error processing user {user_id}: {str(e)}", exc_info=True)
-                errors += 1
-                continue
+        if USE_BATCH_API:
+            # Batch mode: collect batches submitted on earlier ticks, then
+            # submit this tick's users as one Message Batch
+            users_processed, events_generated, errors = run_async(
+                run_batch_tick(connection, users, now)
+            )
+        else:
+            # Process all users concurrently (wall time ~= slowest user, not the sum)
+            users_processed, events_generated, errors = run_async(
+                process_users(connection, users, now)
+            )
 
         logger.info(f"=== Ambient Event Detector Complete ===")
         logger.info(f"Users processed: {users_processed}")
@@ -197,28 +349,162 @@ def lambda_handler(event, context):
                 'error': str(e)
             })
         }
-    finally:
-        if connection:
-            connection.close()
-            logger.info("Database connection closed")
+    # Note: the connection is intentionally NOT closed here — it lives at
+    # module scope and is reused by the next warm invocation
 
 
-def get_db_connection():
-    """Establish MySQL database connection"""
-    return pymysql.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME,
-        cursorclass=pymysql.cursors.DictCursor
+async def process_users(connection, users, now):
+    """
+    Fan out per-user processing with asyncio
+    Claude calls run concurrently (capped by MAX_CONCURRENT_USERS);
+    DB work happens in bulk before and after the fan-out
+    Returns: (users_processed, events_generated, errors)
+    """
+    # One bulk fetch covers every user's context (2 queries total instead of
+    # 2 round-trips per user)
+    contexts = await asyncio.to_thread(
+        fetch_user_contexts, connection, [u['user_id'] for u in users], now
     )
 
+    # Serve users whose context hasn't changed from the response cache
+    # (one bulk lookup) — only cache misses pay for a Claude call
+    hashes = {
+        u['user_id']: context_hash(contexts[u['user_id']])
+        for u in users
+    }
+    cached_responses = await asyncio.to_thread(
+        fetch_cached_responses, connection, list(hashes.values()), now
+    )
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_USERS)
+
+    results = await asyncio.gather(
+        *(
+            process_user(
+                user,
+                contexts.get(user['user_id']),
+                semaphore,
+                now,
+                cached_events=cached_responses.get(hashes[user['user_id']])
+            )
+            for user in users
+        ),
+        return_exceptions=True
+    )
+
+    users_processed = 0
+    errors = 0
+    rows = []
+    cache_rows = []
+    for user, result in zip(users, results):
+        if isinstance(result, Exception):
+            errors += 1
+        else:
+            users_processed += 1
+            event_rows, fresh_events = result
+            rows.extend(event_rows)
+            if fresh_events is not None:
+                cache_rows.append((
+                    hashes[user['user_id']],
+                    user['user_id'],
+                    jdumps(fresh_events)
+                ))
+
+    # One bulk INSERT + commit for the whole tick instead of per-event commits
+    events_generated = store_ambient_events(connection, rows)
+
+    # Remember this tick's fresh responses for the next ticks
+    store_cached_responses(connection, cache_rows, now)
+
+    return users_processed, events_generated, errors
+
+
+async def process_user(user, user_context, semaphore, now, cached_events=None):
+    """
+    Process a single user: detect events from their context, using the
+    cached Claude response when the context hasn't changed
+    Returns: (event row tuples for bulk insertion,
+              fresh Claude events to cache or None on a cache hit)
+    """
+    user_id = user['user_id']
+
+    logger.info(f"Processing user {user_id}")
 
-def get_active_users(connection):
+    try:
+        if cached_events is not None:
+            # Unchanged context: the events from the cached response were
+            # already stored when it was fresh, so there's nothing new to do
+            logger.info(f"Response cache hit for user {user_id}, skipping Claude")
+            return [], None
+
+        # Call Claude to detect ambient events (runs concurrently across users)
+        async with semaphore:
+            detected_events = await detect_ambient_events_with_claude(
+                user_id=user_id,
+                user_context=user_context
+            )
+
+        # A failed call must not be cached as "no events" — that would
+        # suppress detection for this user for the whole cache TTL. Only a
+        # genuine result (including a genuine empty list) is cacheable.
+        if detected_events is None:
+            return [], None
+        fresh_events = detected_events
+
+        rows = []
+        for event_data in detected_events:
+            built = build_ambient_event_row(user_id, event_data, now)
+            if built:
+                event_id, row = built
+                rows.append(row)
+                logger.info(f"Prepared event {event_id}: {event_data['title']}")
+
+                # TODO: Trigger push notification if event_type is 'notification'
+                # This would use APNs (Apple Push Notification service)
+
+        return rows, fresh_events
+
+    except Exception as e:
+        # Full tracebacks only for unexpected failures; formatting one per
+        # user is expensive when a transient outage hits the whole batch
+        if isinstance(e, (pymysql.MySQLError, APIStatusError)):
+            logger.error(f"process_user_failed user={user_id} {type(e).__name__}: {str(e)[:200]}")
+        else:
+            logger.exception(f"process_user_failed user={user_id}")
+        raise
+
+
+def get_db_connection():
+    """
+    Get the shared MySQL connection, reconnecting if the container is cold
+    or the cached connection has gone stale
+    """
+    global _connection
+
+    if _connection is None or not _connection.open:
+        _connection = pymysql.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=get_db_password(),
+            database=DB_NAME,
+            cursorclass=pymysql.cursors.DictCursor,
+            conv=_CONVERSIONS,
+            ssl={'ca': DB_SSL_CA} if DB_SSL_CA else None
+        )
+    else:
+        # Warm container: revive the connection if MySQL timed it out
+        _connection.ping(reconnect=True)
+
+    return _connection
+
+
+def get_active_users(connection, now):
     """
-    Get users who have notifications enabled and active device tokens
-    Returns list of users to process
+    Get users who have notifications enabled, active device tokens, AND
+    something worth detecting — recent activity or a live event. Idle users
+    are filtered out here so Claude is never called for them.
+    Returns list of users to process, busiest first
     """
     with connection.cursor() as cursor:
         cursor.execute("""
@@ -227,95 +513,193 @@ def get_active_users(connection):
                 dt.device_token,
                 dt.notifications_enabled,
                 dt.live_activities_enabled,
-                dt.dynamic_island_enabled
+                dt.dynamic_island_enabled,
+                (SELECT COUNT(*) FROM activity_log al
+                 WHERE al.user_id = dt.user_id
+                 AND al.timestamp >= %s) AS recent_ct,
+                (SELECT COUNT(*) FROM ambient_events ae
+                 WHERE ae.user_id = dt.user_id
+                 AND ae.status = 'active'
+                 AND ae.valid_until > %s) AS active_ct
             FROM device_tokens dt
-            JOIN users u ON u.id = dt.user_id
             WHERE dt.notifications_enabled = TRUE
-            AND dt.last_seen_at >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
-            ORDER BY u.last_active_at DESC
+            AND dt.last_seen_at >= %s
+            HAVING recent_ct > 0 OR active_ct > 0
+            ORDER BY (recent_ct + active_ct) DESC
             LIMIT %s
-        """, (MAX_USERS_PER_RUN,))
+        """, (now - timedelta(hours=2), now, now - timedelta(hours=24), MAX_USERS_PER_RUN))
         return cursor.fetchall()
 
 
-def get_user_context(connection, user_id):
+def fetch_user_contexts(connection, user_ids, now):
     """
-    Gather comprehensive user context for Claude
-    Returns context dict with time, activity patterns, recent queries, etc.
+    Gather comprehensive context for all users in two bulk queries
+    (instead of two round-trips per user)
+    Returns: {user_id: context dict}
     """
-    now = datetime.now()
+    if not user_ids:
+        return {}
 
-    # Get recent activity
+    placeholders = ', '.join(['%s'] * len(user_ids))
+
+    # Recent activity, capped at 50 rows per user via window function
     with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT
-                action_type,
-                query,
-                components_shown,
-                time_of_day,
-                day_of_week,
-                timestamp
-            FROM activity_log
-            WHERE user_id = %s
-            AND timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-            ORDER BY timestamp DESC
-            LIMIT 50
-        """, (user_id,))
-        recent_activity = cursor.fetchall()
-
-    # Get active live activities
+        cursor.execute(f"""
+            SELECT user_id, action_type, query, components_shown,
+                   time_of_day, day_of_week, timestamp
+            FROM (
+                SELECT
+                    user_id, action_type, query, components_shown,
+                    time_of_day, day_of_week, timestamp,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY user_id ORDER BY timestamp DESC
+                    ) AS rn
+                FROM activity_log
+                WHERE user_id IN ({placeholders})
+                AND timestamp >= %s
+            ) ranked
+            WHERE rn <= 50
+            ORDER BY user_id, timestamp DESC
+        """, tuple(user_ids) + (now - timedelta(days=7),))
+        activity_rows = cursor.fetchall()
+
+    # Active live activities, capped at 10 per user
     with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT
-                id,
-                event_type,
-                title,
-                data,
-                start_time,
-                end_time
-            FROM ambient_events
-            WHERE user_id = %s
-            AND status = 'active'
-            AND valid_until > NOW()
-            ORDER BY created_at DESC
-            LIMIT 10
-        """, (user_id,))
-        active_events = cursor.fetchall()
-
-    # Get recent queries
-    recent_queries = []
-    time_patterns = {}
-    for activity in recent_activity:
-        if activity.get('query'):
-            recent_queries.append({
-                'query': activity['query'],
-                'timestamp': activity['timestamp'].isoformat() if activity['timestamp'] else None
-            })
-        tod = activity.get('time_of_day')
-        if tod:
-            time_patterns[tod] = time_patterns.get(tod, 0) + 1
+        cursor.execute(f"""
+            SELECT user_id, id, event_type, title, data, start_time, end_time
+            FROM (
+                SELECT
+                    user_id, id, event_type, title, data, start_time, end_time,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY user_id ORDER BY created_at DESC
+                    ) AS rn
+                FROM ambient_events
+                WHERE user_id IN ({placeholders})
+                AND status = 'active'
+                AND valid_until > %s
+            ) ranked
+            WHERE rn <= 10
+        """, tuple(user_ids) + (now,))
+        event_rows = cursor.fetchall()
+
+    activity_by_user = defaultdict(list)
+    for row in activity_rows:
+        activity_by_user[row['user_id']].append(row)
+
+    events_by_user = defaultdict(list)
+    for row in event_rows:
+        events_by_user[row['user_id']].append(row)
+
+    return {
+        user_id: build_user_context(
+            activity_by_user.get(user_id, []),
+            events_by_user.get(user_id, []),
+            now
+        )
+        for user_id in user_ids
+    }
+
+
+def build_user_context(recent_activity, active_events, now):
+    """
+    Assemble one user's context dict from their pre-fetched activity and events
+    Keys are abbreviated and timestamps are unix seconds — input tokens are
+    billed per byte, and the schema legend lives in the cached system prompt
+    """
+    # Get recent queries (truncated — a 120-char prefix is plenty of signal);
+    # Counter does the tallying in C instead of a dict-get-and-set per row
+    recent_queries = [
+        {
+            'q': a['query'][:120],
+            'ts': int(a['timestamp'].timestamp()) if a['timestamp'] else None
+        }
+        for a in recent_activity if a.get('query')
+    ][:10]
+    time_patterns = dict(Counter(
+        a['time_of_day'] for a in recent_activity if a.get('time_of_day')
+    ))
 
     context = {
-        'current_time': now.isoformat(),
-        'day_of_week': now.strftime('%A'),
-        'time_of_day': get_time_of_day(now),
-        'recent_queries': recent_queries[:10],
-        'time_patterns': time_patterns,
-        'active_events': [
+        't': int(now.timestamp()),
+        'dow': now.strftime('%A'),
+        'tod': get_time_of_day(now),
+        'rq': recent_queries,
+        'tp': time_patterns,
+        'ae': [
             {
                 'id': str(evt['id']),
                 'type': evt['event_type'],
                 'title': evt['title'],
-                'data': json.loads(evt['data']) if evt['data'] else {}
+                # Already a dict — the driver decodes JSON columns (see _CONVERSIONS)
+                'data': evt['data'] or {}
             }
             for evt in active_events
-        ],
-        'total_recent_activities': len(recent_activity)
+        ]
     }
 
     return context
 
 
+def context_hash(user_context):
+    """
+    Hash the stable parts of a user context for response-cache lookups
+    The current timestamp ('t') changes every tick and would defeat the
+    cache, so it's excluded — 'tod'/'dow' still participate
+    """
+    stable = {k: v for k, v in user_context.items() if k != 't'}
+    return hashlib.blake2b(
+        json.dumps(stable, sort_keys=True, default=str).encode(),
+        digest_size=16
+    ).hexdigest()
+
+
+def fetch_cached_responses(connection, ctx_hashes, now):
+    """
+    Look up still-fresh cached Claude responses for this tick's context hashes
+    Returns: {ctx_hash: list of events}
+    """
+    if not ctx_hashes:
+        return {}
+
+    placeholders = ', '.join(['%s'] * len(ctx_hashes))
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT ctx_hash, response
+            FROM claude_response_cache
+            WHERE ctx_hash IN ({placeholders})
+            AND created_at > %s
+        """, tuple(ctx_hashes) + (now - timedelta(minutes=RESPONSE_CACHE_TTL_MINUTES),))
+        rows = cursor.fetchall()
+
+    # response is a JSON column — the connection's FIELD_TYPE.JSON converter
+    # has already decoded it to a list, so no jloads here
+    return {row['ctx_hash']: row['response'] for row in rows}
+
+
+def store_cached_responses(connection, cache_rows, now):
+    """
+    Upsert this tick's fresh Claude responses into the response cache
+    cache_rows: list of (ctx_hash, user_id, response_json) tuples
+    """
+    if not cache_rows:
+        return
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO claude_response_cache (ctx_hash, user_id, response, created_at)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    response = VALUES(response),
+                    created_at = VALUES(created_at)
+            """, [row + (now,) for row in cache_rows])
+        connection.commit()
+    except Exception as e:
+        # Cache writes are best-effort; never fail the tick over them
+        logger.error(f"Failed to store cached responses: {str(e)}")
+        connection.rollback()
+
+
 def get_time_of_day(dt):
     """Categorize time of day"""
     hour = dt.hour
@@ -329,58 +713,190 @@ def get_time_of_day(dt):
         return 'night'
 
 
-def detect_ambient_events_with_claude(user_id, user_context):
+def build_detection_prompt(user_context):
     """
-    Call Claude API to detect time-sensitive ambient events
-    Returns: List of event objects or [] if none detected
+    Build the per-user message for one user's context
+    (the static instructions live in the cached system block)
+    Dumped compact — indentation adds ~30% input bytes for no model benefit
     """
-    try:
-        # Build prompt
-        prompt = f"""{AMBIENT_EVENT_DETECTOR_PROMPT}
-
-USER CONTEXT:
-{json.dumps(user_context, indent=2)}
+    return f"""USER CONTEXT:
+{jdumps(user_context)}
 
 Analyze this context and detect any time-sensitive moments that deserve immediate attention.
-Return ONLY valid JSON with detected events, or {{"events": []}} if nothing is time-sensitive right now."""
+Report the detected events via the emit_events tool, or an empty events list if nothing is time-sensitive right now."""
+
 
-        # Call Claude API
-        client = Anthropic(api_key=CLAUDE_API_KEY)
+def extract_events(message, user_id):
+    """
+    Pull the event list out of the forced tool_use block — already a dict,
+    no json.loads and no prose-wrapped-JSON failure mode
+    Returns: List of events or [] if the block is missing
+    """
+    for block in message.content:
+        if block.type == 'tool_use':
+            events = block.input.get('events', [])
+            logger.info(f"Claude detected {len(events)} events for user {user_id}")
+            return events
 
-        message = client.messages.create(
+    logger.error(f"No tool_use block in Claude response for user {user_id}")
+    return []
+
+
+async def detect_ambient_events_with_claude(user_id, user_context):
+    """
+    Call Claude API to detect time-sensitive ambient events
+    Returns: List of event objects ([] if none detected), or None when the
+    call failed — callers must not treat a failure as an empty detection
+    """
+    try:
+        # Call Claude API (shared async client); tool_choice forces the
+        # response through the emit_events schema
+        message = await anthropic_client.messages.create(
             model=CLAUDE_MODEL,
             max_tokens=2000,
             temperature=0.7,
+            system=SYSTEM_BLOCKS,
             messages=[{
                 "role": "user",
-                "content": prompt
-            }]
+                "content": build_detection_prompt(user_context)
+            }],
+            tools=[EMIT_EVENTS_TOOL],
+            tool_choice=EMIT_EVENTS_TOOL_CHOICE,
+            extra_headers=PROMPT_CACHING_HEADERS
         )
 
-        # Parse response
-        response_text = message.content[0].text
-        logger.info(f"Claude response: {response_text[:200]}...")
+        return extract_events(message, user_id)
 
-        # Parse JSON
-        response_data = json.loads(response_text)
-        events = response_data.get('events', [])
+    except Exception as e:
+        if isinstance(e, APIStatusError):
+            logger.error(f"Claude API error {type(e).__name__}: {str(e)[:200]}")
+        else:
+            logger.exception("Claude API error")
+        return None
 
-        logger.info(f"Claude detected {len(events)} events for user {user_id}")
-        return events
 
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse Claude response as JSON: {str(e)}")
-        logger.error(f"Response was: {response_text}")
-        return []
-    except Exception as e:
-        logger.error(f"Claude API error: {str(e)}", exc_info=True)
-        return []
+async def run_batch_tick(connection, users, now):
+    """
+    Batch-mode tick:
+    1. Collect results from Message Batches submitted on earlier ticks
+    2. Submit one new batch covering this tick's users
+    Returns: (users_submitted, events_generated, errors)
+    """
+    events_generated, errors = await collect_completed_batches(connection, now)
+    users_submitted = await submit_event_batch(connection, users, now)
+    return users_submitted, events_generated, errors
+
+
+async def submit_event_batch(connection, users, now):
+    """
+    Submit one Message Batch with a detection prompt per user
+    custom_id routes each result back to its user at collection time
+    Returns: number of requests submitted
+    """
+    contexts = fetch_user_contexts(connection, [u['user_id'] for u in users], now)
+
+    requests = []
+    for user in users:
+        user_id = user['user_id']
+        user_context = contexts.get(user_id)
+        requests.append({
+            "custom_id": user_id,
+            "params": {
+                "model": CLAUDE_MODEL,
+                "max_tokens": 2000,
+                "temperature": 0.7,
+                "system": SYSTEM_BLOCKS,
+                "messages": [{
+                    "role": "user",
+                    "content": build_detection_prompt(user_context)
+                }],
+                "tools": [EMIT_EVENTS_TOOL],
+                "tool_choice": EMIT_EVENTS_TOOL_CHOICE
+            }
+        })
+
+    if not requests:
+        return 0
+
+    batch = await anthropic_client.messages.batches.create(requests=requests)
+
+    # Track the batch so a later tick can collect its results
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO claude_batches (id, source, request_count, status, created_at)
+            VALUES (%s, %s, %s, 'submitted', %s)
+        """, (batch.id, BATCH_SOURCE, len(requests), now))
+        connection.commit()
+
+    logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+    return len(requests)
 
 
-def store_ambient_event(connection, user_id, event_data):
+async def collect_completed_batches(connection, now):
     """
-    Store generated ambient event in ambient_events table
-    Returns: event_id or None on failure
+    Retrieve batches submitted on earlier ticks and store events from any
+    that have finished processing
+    Returns: (events_generated, errors)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT id FROM claude_batches
+            WHERE source = %s AND status = 'submitted'
+        """, (BATCH_SOURCE,))
+        pending = cursor.fetchall()
+
+    events_generated = 0
+    errors = 0
+
+    for row in pending:
+        batch_id = row['id']
+        try:
+            batch = await anthropic_client.messages.batches.retrieve(batch_id)
+            if batch.processing_status != 'ended':
+                continue
+
+            event_rows = []
+            # The async results() coroutine resolves to the JSONL decoder,
+            # so it has to be awaited before iterating
+            async for result in await anthropic_client.messages.batches.results(batch_id):
+                user_id = result.custom_id
+                if result.result.type != 'succeeded':
+                    logger.error(f"Batch request failed for user {user_id}: {result.result.type}")
+                    errors += 1
+                    continue
+
+                events = extract_events(result.result.message, user_id)
+                for event_data in events:
+                    built = build_ambient_event_row(user_id, event_data, now)
+                    if built:
+                        event_id, event_row = built
+                        event_rows.append(event_row)
+                        logger.info(f"Prepared event {event_id}: {event_data['title']}")
+
+            events_generated += store_ambient_events(connection, event_rows)
+
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE claude_batches
+                    SET status = 'collected', collected_at = %s
+                    WHERE id = %s
+                """, (now, batch_id))
+                connection.commit()
+
+        except Exception as e:
+            if isinstance(e, (pymysql.MySQLError, APIStatusError)):
+                logger.error(f"collect_batch_failed batch={batch_id} {type(e).__name__}: {str(e)[:200]}")
+            else:
+                logger.exception(f"collect_batch_failed batch={batch_id}")
+            errors += 1
+
+    return events_generated, errors
+
+
+def build_ambient_event_row(user_id, event_data, now):
+    """
+    Build one ambient_events row tuple for bulk insertion
+    Returns: (event_id, row) or None if the event data can't be mapped
     """
     event_id = str(uuid4())
 
@@ -412,12 +928,38 @@ def store_ambient_event(connection, user_id, event_data):
                 pass
 
         # Default validity: 1 hour from now
-        valid_until = datetime.now() + timedelta(hours=1)
+        valid_until = now + timedelta(hours=1)
         if end_time:
             valid_until = end_time + timedelta(minutes=15)
 
+        return event_id, (
+            event_id, user_id, event_type, priority,
+            title, subtitle, body, jdumps(data),
+            icon, color,
+            start_time, end_time, valid_until,
+            'pending', confidence_score,
+            'claude', now
+        )
+
+    except Exception as e:
+        logger.error(f"Failed to build ambient event row: {type(e).__name__}: {str(e)[:200]}")
+        return None
+
+
+def store_ambient_events(connection, rows):
+    """
+    Bulk-insert ambient event rows with one executemany + one commit
+    (instead of one round-trip and fsync per event)
+    Rows carry the invocation timestamp as created_at, so every event from
+    one tick shares the same clock reading
+    Returns: number of events stored
+    """
+    if not rows:
+        return 0
+
+    try:
         with connection.cursor() as cursor:
-            cursor.execute("""
+            cursor.executemany("""
                 INSERT INTO ambient_events (
                     id, user_id, event_type, priority,
                     title, subtitle, body, data,
@@ -431,22 +973,15 @@ def store_ambient_event(connection, user_id, event_data):
                     %s, %s,
                     %s, %s, %s,
                     %s, %s,
-                    %s, NOW()
+                    %s, %s
                 )
-            """, (
-                event_id, user_id, event_type, priority,
-                title, subtitle, body, json.dumps(data),
-                icon, color,
-                start_time, end_time, valid_until,
-                'pending', confidence_score,
-                'claude'
-            ))
-            connection.commit()
-
-            logger.info(f"Stored ambient event {event_id}: {title}")
-            return event_id
+            """, rows)
+        connection.commit()
+
+        logger.info(f"Stored {len(rows)} ambient events")
+        return len(rows)
 
     except Exception as e:
-        logger.error(f"Failed to store ambient event: {str(e)}", exc_info=True)
+        logger.error(f"Failed to store ambient events: {type(e).__name__}: {str(e)[:200]}")
         connection.rollback()
-        return None
+        return 0
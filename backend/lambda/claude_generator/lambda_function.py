@@ -15,30 +15,118 @@ FLOW:
 4. Update queue status to 'completed'
 """
 
+import hashlib
 import json
 import os
 import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from uuid import uuid4
+import httpx
 import pymysql
-from anthropic import Anthropic
-
-# Configure logging
+from pymysql.constants import FIELD_TYPE
+from anthropic import Anthropic, APIStatusError
+
+# orjson is ~3-10x faster than stdlib json on the dicts we serialize into
+# prompts and DB rows; fall back to stdlib if the layer doesn't bundle it
+try:
+    import orjson
+
+    def jdumps(obj, indent=False):
+        """Serialize obj to a JSON string"""
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, option=option).decode()
+
+    jloads = orjson.loads
+except ImportError:
+    def jdumps(obj, indent=False):
+        """Serialize obj to a JSON string"""
+        return json.dumps(obj, indent=2 if indent else None)
+
+    jloads = json.loads
+
+# generation_queue.context_data is a native JSON column; decoding it in the
+# driver hands rows back with the field already a dict, removing the per-job
+# json.loads from the hot loop
+_CONVERSIONS = dict(pymysql.converters.conversions)
+_CONVERSIONS[FIELD_TYPE.JSON] = jloads
+
+# Configure logging (WARNING in production: the per-job INFO lines cost
+# string formatting and CloudWatch ingestion for no operational value)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
 # Environment variables
 DB_HOST = os.environ['DB_HOST']
 DB_PORT = int(os.environ.get('DB_PORT', 3306))
 DB_NAME = os.environ['DB_NAME']
 DB_USER = os.environ['DB_USER']
-DB_PASSWORD = os.environ['DB_PASSWORD']
+DB_PASSWORD = os.environ.get('DB_PASSWORD', '')
 CLAUDE_API_KEY = os.environ['CLAUDE_API_KEY']
 
+# RDS Proxy support: point DB_HOST at the proxy endpoint and set
+# DB_USE_IAM_AUTH=true to authenticate with short-lived IAM tokens instead
+# of a static password (requires TLS, so set DB_SSL_CA to the RDS CA bundle)
+DB_USE_IAM_AUTH = os.environ.get('DB_USE_IAM_AUTH', 'false').lower() == 'true'
+DB_SSL_CA = os.environ.get('DB_SSL_CA')  # e.g. /opt/rds-ca.pem
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-2')
+
 # Claude configuration
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
 MAX_JOBS_PER_RUN = 10
 MAX_ATTEMPTS = 3
+STALE_PROCESSING_MINUTES = 10  # reclaim 'processing' jobs older than this
+MAX_CONCURRENT_JOBS = 10  # Thread pool size for overlapping Claude calls
+
+# Message Batches API mode: 50% cost and a separate rate-limit pool, at the
+# price of pages landing on a later tick instead of inline
+USE_BATCH_API = os.environ.get('CLAUDE_USE_BATCHES', 'false').lower() == 'true'
+BATCH_SOURCE = 'claude_generator'
+
+# Module-level client so warm Lambda containers reuse the HTTP session.
+# HTTP/2 multiplexes all concurrent generation calls over one TCP+TLS
+# connection — in a VPC Lambda each extra handshake is ~200ms, so without
+# it a 10-wide thread pool opens 10 connections on a cold pool
+anthropic_client = Anthropic(
+    api_key=CLAUDE_API_KEY,
+    http_client=httpx.Client(
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+    )
+)
+
+# Module-level DB connection, reused across warm invocations (avoids paying
+# TCP + TLS + MySQL auth on every tick and keeps RDS connection count flat)
+_connection = None
+
+# Cached IAM auth token (tokens live 15 minutes; refresh at 14)
+_iam_token = None
+_iam_token_expires = None
+
+
+def get_db_password():
+    """
+    Resolve the DB credential: the static password normally, or a generated
+    IAM auth token when connecting through RDS Proxy with IAM auth
+    """
+    global _iam_token, _iam_token_expires
+
+    if not DB_USE_IAM_AUTH:
+        return DB_PASSWORD
+
+    now = datetime.now()
+    if _iam_token is None or now >= _iam_token_expires:
+        import boto3
+        _iam_token = boto3.client('rds', region_name=AWS_REGION).generate_db_auth_token(
+            DBHostname=DB_HOST,
+            Port=DB_PORT,
+            DBUsername=DB_USER
+        )
+        _iam_token_expires = now + timedelta(minutes=14)
+
+    return _iam_token
 
 # Ambient Intelligence System Prompt
 AMBIENT_INTELLIGENCE_PROMPT = """You are Ambia's ambient intelligence engine - an AI that generates contextual information before users ask.
@@ -69,6 +157,52 @@ RESPONSE FORMAT (return ONLY valid JSON):
 
 Make it feel like you're reading the user's mind. Be proactive, contextual, and helpful."""
 
+# Static system block with prompt caching: the generation prompt is identical
+# on every call, so Anthropic caches the prefix server-side (~5 min TTL —
+# always warm at a 2-minute tick) and only the per-job context is billed at
+# full rate
+SYSTEM_BLOCKS = [{
+    "type": "text",
+    "text": AMBIENT_INTELLIGENCE_PROMPT,
+    "cache_control": {"type": "ephemeral"}
+}]
+PROMPT_CACHING_HEADERS = {"anthropic-beta": "prompt-caching-2024-07-31"}
+
+# Forced tool schema: Claude must answer through this tool, so the response
+# arrives as a structured dict instead of free text that may fail json.loads
+EMIT_COMPONENTS_TOOL = {
+    "name": "emit_components",
+    "description": "Return the contextual UI components generated for the "
+                   "user's predicted need.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "components": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "type": {
+                            "type": "string",
+                            "enum": ["weather", "calendar", "tasks", "movies",
+                                     "books", "news", "recipes", "sports"]
+                        },
+                        "title": {"type": "string"},
+                        "priority": {
+                            "type": "string",
+                            "enum": ["high", "medium", "low"]
+                        },
+                        "data": {"type": "object"}
+                    },
+                    "required": ["type", "title", "priority", "data"]
+                }
+            }
+        },
+        "required": ["components"]
+    }
+}
+EMIT_COMPONENTS_TOOL_CHOICE = {"type": "tool", "name": "emit_components"}
+
 
 def lambda_handler(event, context):
     """
@@ -83,8 +217,36 @@ def lambda_handler(event, context):
         connection = get_db_connection()
         logger.info("Database connected successfully")
 
+        # One timestamp per invocation, bound into queries as a parameter:
+        # identical statement text enables plan reuse, and every row written
+        # this tick carries the same created_at
+        now = datetime.now()
+
+        if USE_BATCH_API:
+            # Batch mode: collect batches submitted on earlier ticks, then
+            # submit this tick's jobs as one Message Batch
+            pages_generated, errors = collect_completed_batches(connection, now)
+
+            jobs = get_pending_jobs(connection, now)
+            jobs_submitted = submit_generation_batch(connection, jobs, now)
+
+            logger.info(f"=== Claude Generator Complete (batch mode) ===")
+            logger.info(f"Jobs submitted: {jobs_submitted}")
+            logger.info(f"Pages generated: {pages_generated}")
+            logger.info(f"Errors: {errors}")
+
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'success': True,
+                    'jobs_processed': jobs_submitted,
+                    'pages_generated': pages_generated,
+                    'errors': errors
+                })
+            }
+
         # Get pending jobs from queue
-        jobs = get_pending_jobs(connection)
+        jobs = get_pending_jobs(connection, now)
         logger.info(f"Found {len(jobs)} pending jobs")
 
         if not jobs:
@@ -102,61 +264,88 @@ def lambda_handler(event, context):
         pages_generated = 0
         errors = 0
 
-        # Process each job
-        for job in jobs:
-            job_id = job['id']
-            user_id = job['user_id']
-
-            logger.info(f"Processing job {job_id} for user {user_id}")
-
-            try:
-                # Mark as processing
-                update_job_status(connection, job_id, 'processing')
-
-                # Parse context data
-                context_data = json.loads(job['context_data']) if job['context_data'] else {}
-
-                # Get user activity context
-                user_context = get_user_context(connection, user_id)
-
-                # Call Claude to generate components
-                components = generate_components_with_claude(
-                    user_id=user_id,
-                    predicted_need=job['predicted_need'],
-                    pattern=context_data,
-                    user_context=user_context
-                )
-
-                if components:
-                    # Store in page_cache
-                    cache_id = store_in_page_cache(
-                        connection=connection,
-                        user_id=user_id,
-                        components=components,
-                        pattern=context_data
-                    )
-
-                    # Update job as completed
-                    update_job_status(
-                        connection=connection,
-                        job_id=job_id,
-                        status='completed',
-                        result_cache_key=cache_id
-                    )
-
-                    jobs_processed += 1
-                    pages_generated += 1
-                    logger.info(f"Successfully generated page for job {job_id}")
-                else:
-                    # Failed to generate
-                    handle_job_failure(connection, job, "Failed to generate components")
-                    errors += 1
-
-            except Exception as e:
-                logger.error(f"Error processing job {job_id}: {str(e)}", exc_info=True)
-                handle_job_failure(connection, job, str(e))
-                errors += 1
-                continue
+        # The jobs are already claimed as 'processing'; if anything below
+        # raises before a job reaches a terminal status, release the
+        # unsettled ones on the way out (mirrors the batch-submit path) so
+        # they aren't stranded where nothing ever retries them
+        settled = set()
+        try:
+            # One bulk fetch covers every job's user context
+            contexts = fetch_user_contexts(connection, [j['user_id'] for j in jobs], now)
+
+            # Overlap the Claude calls across a thread pool — the HTTP wait
+            # releases the GIL, so up to MAX_CONCURRENT_JOBS latencies run
+            # in parallel. All DB work stays on the main thread's shared
+            # connection (pymysql connections are not thread-safe).
+            job_inputs = []
+            for job in jobs:
+                logger.info(f"Processing job {job['id']} for user {job['user_id']}")
+                context_data = job['context_data'] or {}
+                job_inputs.append((job, context_data))
+
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS) as executor:
+                futures = {
+                    executor.submit(
+                        generate_components_with_claude,
+                        job['user_id'],
+                        job['predicted_need'],
+                        context_data,
+                        contexts.get(job['user_id'], "No recent activity")
+                    ): (job, context_data)
+                    for job, context_data in job_inputs
+                }
+
+                for future in as_completed(futures):
+                    job, context_data = futures[future]
+                    job_id = job['id']
+
+                    try:
+                        components = future.result()
+
+                        if components:
+                            # Store in page_cache
+                            cache_id = store_in_page_cache(
+                                connection=connection,
+                                user_id=job['user_id'],
+                                components=components,
+                                pattern=context_data,
+                                now=now
+                            )
+
+                            # Update job as completed
+                            update_job_status(
+                                connection=connection,
+                                job_id=job_id,
+                                status='completed',
+                                now=now,
+                                result_cache_key=cache_id
+                            )
+
+                            settled.add(job_id)
+                            jobs_processed += 1
+                            pages_generated += 1
+                            logger.info(f"Successfully generated page for job {job_id}")
+                        else:
+                            # Failed to generate
+                            handle_job_failure(connection, job, "Failed to generate components", now)
+                            settled.add(job_id)
+                            errors += 1
+
+                    except Exception as e:
+                        # Full tracebacks only for unexpected failures;
+                        # formatting one per job is expensive when a
+                        # transient outage hits the whole batch
+                        if isinstance(e, (pymysql.MySQLError, APIStatusError)):
+                            logger.error(f"process_job_failed job={job_id} {type(e).__name__}: {str(e)[:200]}")
+                        else:
+                            logger.exception(f"process_job_failed job={job_id}")
+                        handle_job_failure(connection, job, str(e), now)
+                        settled.add(job_id)
+                        errors += 1
+                        continue
+        except Exception:
+            release_jobs(connection, [j for j in jobs if j['id'] not in settled])
+            raise
 
         logger.info(f"=== Claude Generator Complete ===")
         logger.info(f"Jobs processed: {jobs_processed}")
@@ -182,151 +371,387 @@ def lambda_handler(event, context):
                 'error': str(e)
             })
         }
-    finally:
-        if connection:
-            connection.close()
-            logger.info("Database connection closed")
+    # Note: the connection is intentionally NOT closed here — it lives at
+    # module scope and is reused by the next warm invocation
 
 
 def get_db_connection():
-    """Establish MySQL database connection"""
-    return pymysql.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME,
-        cursorclass=pymysql.cursors.DictCursor
-    )
+    """
+    Get the shared MySQL connection, reconnecting if the container is cold
+    or the cached connection has gone stale
+    """
+    global _connection
+
+    if _connection is None or not _connection.open:
+        _connection = pymysql.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=get_db_password(),
+            database=DB_NAME,
+            cursorclass=pymysql.cursors.DictCursor,
+            conv=_CONVERSIONS,
+            ssl={'ca': DB_SSL_CA} if DB_SSL_CA else None
+        )
+    else:
+        # Warm container: revive the connection if MySQL timed it out
+        _connection.ping(reconnect=True)
+
+    return _connection
 
 
-def get_pending_jobs(connection):
+def get_pending_jobs(connection, now):
     """
-    Get pending jobs from generation_queue
+    Claim pending jobs from generation_queue atomically
     Prioritizes by priority (DESC) and scheduled_for (ASC)
     Skips jobs that have exceeded max attempts
+
+    SELECT ... FOR UPDATE SKIP LOCKED plus the status flip run in one
+    transaction: when invocations overlap, a second container skips rows
+    the first has locked instead of grabbing the same jobs and paying for
+    duplicate Claude calls. Returned jobs are already 'processing'.
     """
     with connection.cursor() as cursor:
+        # Reclaim jobs stranded in 'processing' by a crashed or timed-out
+        # earlier invocation — a started_at this old means nothing is still
+        # working on them, and nothing else ever resets non-queued rows
+        cursor.execute("""
+            UPDATE generation_queue
+            SET status = 'queued', started_at = NULL
+            WHERE status = 'processing'
+            AND started_at < %s
+        """, (now - timedelta(minutes=STALE_PROCESSING_MINUTES),))
+
         cursor.execute("""
             SELECT
                 id, user_id, job_type, priority, predicted_need,
                 context_data, scheduled_for, valid_until, attempts
             FROM generation_queue
             WHERE status = 'queued'
-            AND scheduled_for <= NOW()
-            AND valid_until > NOW()
+            AND scheduled_for <= %s
+            AND valid_until > %s
             AND attempts < %s
             ORDER BY priority DESC, scheduled_for ASC
             LIMIT %s
-        """, (MAX_ATTEMPTS, MAX_JOBS_PER_RUN))
-        return cursor.fetchall()
+            FOR UPDATE SKIP LOCKED
+        """, (now, now, MAX_ATTEMPTS, MAX_JOBS_PER_RUN))
+        jobs = cursor.fetchall()
+
+        if jobs:
+            placeholders = ', '.join(['%s'] * len(jobs))
+            cursor.execute(f"""
+                UPDATE generation_queue
+                SET status = 'processing', started_at = %s
+                WHERE id IN ({placeholders})
+            """, [now] + [job['id'] for job in jobs])
+
+    connection.commit()
+    return jobs
 
 
-def get_user_context(connection, user_id):
+def release_jobs(connection, jobs):
     """
-    Get user activity context from activity_log
-    Returns recent activity summary for Claude
+    Flip claimed jobs back to 'queued' so a later tick can retry them
+    Nothing ever selects 'processing' rows, so a job stranded there after a
+    failed batch submit would be dropped permanently
     """
+    if not jobs:
+        return
+
+    placeholders = ', '.join(['%s'] * len(jobs))
     with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT
-                action_type,
-                query,
-                components_shown,
-                time_of_day,
-                day_of_week,
-                timestamp
-            FROM activity_log
-            WHERE user_id = %s
-            AND timestamp >= DATE_SUB(NOW(), INTERVAL 14 DAY)
-            ORDER BY timestamp DESC
-            LIMIT 50
-        """, (user_id,))
-
-        activity = cursor.fetchall()
-
-        if not activity:
-            return "No recent activity"
-
-        # Build context summary
-        recent_queries = []
-        time_patterns = {}
-
-        for record in activity:
-            if record.get('query'):
-                recent_queries.append(record['query'])
-
-            tod = record.get('time_of_day')
-            if tod:
-                time_patterns[tod] = time_patterns.get(tod, 0) + 1
+        cursor.execute(f"""
+            UPDATE generation_queue
+            SET status = 'queued', started_at = NULL
+            WHERE id IN ({placeholders})
+        """, [job['id'] for job in jobs])
+    connection.commit()
 
-        return {
-            'recent_queries': recent_queries[:10],
-            'time_patterns': time_patterns,
-            'total_activities': len(activity)
-        }
 
+def fetch_user_contexts(connection, user_ids, now):
+    """
+    Get activity context for all jobs' users in one bulk query
+    (instead of one round-trip per job)
+    Returns: {user_id: activity summary for Claude}
+    """
+    unique_ids = list(dict.fromkeys(user_ids))
+    if not unique_ids:
+        return {}
 
-def generate_components_with_claude(user_id, predicted_need, pattern, user_context):
+    placeholders = ', '.join(['%s'] * len(unique_ids))
+
+    # Recent activity, capped at 50 rows per user via window function
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT user_id, action_type, query, components_shown,
+                   time_of_day, day_of_week, timestamp
+            FROM (
+                SELECT
+                    user_id, action_type, query, components_shown,
+                    time_of_day, day_of_week, timestamp,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY user_id ORDER BY timestamp DESC
+                    ) AS rn
+                FROM activity_log
+                WHERE user_id IN ({placeholders})
+                AND timestamp >= %s
+            ) ranked
+            WHERE rn <= 50
+            ORDER BY user_id, timestamp DESC
+        """, tuple(unique_ids) + (now - timedelta(days=14),))
+        activity_rows = cursor.fetchall()
+
+    activity_by_user = defaultdict(list)
+    for row in activity_rows:
+        activity_by_user[row['user_id']].append(row)
+
+    return {
+        user_id: build_user_context(activity_by_user.get(user_id, []))
+        for user_id in unique_ids
+    }
+
+
+def build_user_context(activity):
     """
-    Call Claude API to generate UI components
-    Returns: List of component objects or None on failure
+    Build one user's activity summary from their pre-fetched activity rows
+    Returns recent activity summary for Claude
     """
-    try:
-        # Build prompt
-        prompt = f"""{AMBIENT_INTELLIGENCE_PROMPT}
+    if not activity:
+        return "No recent activity"
+
+    # Build context summary; Counter does the tallying in C instead of a
+    # dict-get-and-set per row
+    recent_queries = [r['query'] for r in activity if r.get('query')][:10]
+    time_patterns = dict(Counter(
+        r['time_of_day'] for r in activity if r.get('time_of_day')
+    ))
+
+    return {
+        'recent_queries': recent_queries,
+        'time_patterns': time_patterns,
+        'total_activities': len(activity)
+    }
 
-USER CONTEXT:
-{json.dumps(user_context, indent=2)}
+
+def build_generation_prompt(predicted_need, pattern, user_context):
+    """
+    Build the per-job message for one job
+    (the static instructions live in the cached system block)
+    Dumped compact — indentation adds ~30% input bytes for no model benefit
+    """
+    return f"""USER CONTEXT:
+{jdumps(user_context)}
 
 DETECTED PATTERN:
-{json.dumps(pattern, indent=2)}
+{jdumps(pattern)}
 
 PREDICTED NEED:
 {predicted_need}
 
 Generate a contextual UI response for this prediction. Return ONLY valid JSON."""
 
-        # Call Claude API
-        client = Anthropic(api_key=CLAUDE_API_KEY)
 
-        message = client.messages.create(
+def extract_components(message):
+    """
+    Pull the component list out of the forced tool_use block — already a
+    dict, no json.loads and no prose-wrapped-JSON failure mode
+    Returns: List of components or None if empty/missing
+    """
+    for block in message.content:
+        if block.type == 'tool_use':
+            components = block.input.get('components', [])
+
+            if not components:
+                logger.warning("Claude returned no components")
+                return None
+
+            logger.info(f"Claude generated {len(components)} components")
+            return components
+
+    logger.error("No tool_use block in Claude response")
+    return None
+
+
+def generate_components_with_claude(user_id, predicted_need, pattern, user_context):
+    """
+    Call Claude API to generate UI components
+    Returns: List of component objects or None on failure
+    """
+    try:
+        # Call Claude API (shared client); tool_choice forces the response
+        # through the emit_components schema
+        message = anthropic_client.messages.create(
             model=CLAUDE_MODEL,
             max_tokens=2000,
             temperature=0.7,
+            system=SYSTEM_BLOCKS,
             messages=[{
                 "role": "user",
-                "content": prompt
-            }]
+                "content": build_generation_prompt(predicted_need, pattern, user_context)
+            }],
+            tools=[EMIT_COMPONENTS_TOOL],
+            tool_choice=EMIT_COMPONENTS_TOOL_CHOICE,
+            extra_headers=PROMPT_CACHING_HEADERS
         )
 
-        # Parse response
-        response_text = message.content[0].text
-        logger.info(f"Claude response: {response_text[:200]}...")
+        return extract_components(message)
+
+    except Exception as e:
+        if isinstance(e, APIStatusError):
+            logger.error(f"Claude API error {type(e).__name__}: {str(e)[:200]}")
+        else:
+            logger.exception("Claude API error")
+        return None
 
-        # Parse JSON
-        response_data = json.loads(response_text)
-        components = response_data.get('components', [])
 
-        if not components:
-            logger.warning("Claude returned no components")
-            return None
+def submit_generation_batch(connection, jobs, now):
+    """
+    Submit one Message Batch with a generation prompt per job
+    Jobs arrive already claimed as 'processing' by get_pending_jobs, so the
+    next tick doesn't re-submit them; custom_id routes each result back to
+    its job at collection time
+    Returns: number of requests submitted
+    """
+    contexts = fetch_user_contexts(connection, [j['user_id'] for j in jobs], now)
+
+    requests = []
+    for job in jobs:
+        job_id = job['id']
+        pattern = job['context_data'] or {}
+        user_context = contexts.get(job['user_id'], "No recent activity")
+
+        requests.append({
+            "custom_id": job_id,
+            "params": {
+                "model": CLAUDE_MODEL,
+                "max_tokens": 2000,
+                "temperature": 0.7,
+                "system": SYSTEM_BLOCKS,
+                "messages": [{
+                    "role": "user",
+                    "content": build_generation_prompt(
+                        job['predicted_need'], pattern, user_context
+                    )
+                }],
+                "tools": [EMIT_COMPONENTS_TOOL],
+                "tool_choice": EMIT_COMPONENTS_TOOL_CHOICE
+            }
+        })
 
-        logger.info(f"Claude generated {len(components)} components")
-        return components
+    if not requests:
+        return 0
 
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse Claude response as JSON: {str(e)}")
-        logger.error(f"Response was: {response_text}")
-        return None
-    except Exception as e:
-        logger.error(f"Claude API error: {str(e)}", exc_info=True)
-        return None
+    try:
+        batch = anthropic_client.messages.batches.create(requests=requests)
+    except Exception:
+        # The jobs are already marked 'processing'; put them back in the
+        # queue before propagating, or no tick would ever retry them
+        release_jobs(connection, jobs)
+        raise
+
+    # Track the batch so a later tick can collect its results
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO claude_batches (id, source, request_count, status, created_at)
+            VALUES (%s, %s, %s, 'submitted', %s)
+        """, (batch.id, BATCH_SOURCE, len(requests), now))
+        connection.commit()
+
+    logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+    return len(requests)
+
+
+def collect_completed_batches(connection, now):
+    """
+    Retrieve batches submitted on earlier ticks and store pages from any
+    that have finished processing
+    Returns: (pages_generated, errors)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT id FROM claude_batches
+            WHERE source = %s AND status = 'submitted'
+        """, (BATCH_SOURCE,))
+        pending = cursor.fetchall()
+
+    pages_generated = 0
+    errors = 0
+
+    for row in pending:
+        batch_id = row['id']
+        try:
+            batch = anthropic_client.messages.batches.retrieve(batch_id)
+            if batch.processing_status != 'ended':
+                continue
+
+            for result in anthropic_client.messages.batches.results(batch_id):
+                job_id = result.custom_id
+
+                # Re-fetch the job for its pattern context
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT id, user_id, context_data, attempts
+                        FROM generation_queue
+                        WHERE id = %s
+                    """, (job_id,))
+                    job = cursor.fetchone()
+
+                if not job:
+                    logger.warning(f"Batch result for unknown job {job_id}")
+                    continue
+
+                if result.result.type != 'succeeded':
+                    handle_job_failure(connection, job, f"Batch request {result.result.type}", now)
+                    errors += 1
+                    continue
 
+                components = extract_components(result.result.message)
 
-def store_in_page_cache(connection, user_id, components, pattern):
+                if components:
+                    pattern = job['context_data'] or {}
+                    cache_id = store_in_page_cache(
+                        connection=connection,
+                        user_id=job['user_id'],
+                        components=components,
+                        pattern=pattern,
+                        now=now
+                    )
+                    update_job_status(
+                        connection=connection,
+                        job_id=job_id,
+                        status='completed',
+                        now=now,
+                        result_cache_key=cache_id
+                    )
+                    pages_generated += 1
+                else:
+                    handle_job_failure(connection, job, "Failed to generate components", now)
+                    errors += 1
+
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE claude_batches
+                    SET status = 'collected', collected_at = %s
+                    WHERE id = %s
+                """, (now, batch_id))
+                connection.commit()
+
+        except Exception as e:
+            if isinstance(e, (pymysql.MySQLError, APIStatusError)):
+                logger.error(f"collect_batch_failed batch={batch_id} {type(e).__name__}: {str(e)[:200]}")
+            else:
+                logger.exception(f"collect_batch_failed batch={batch_id}")
+            errors += 1
+
+    return pages_generated, errors
+
+
+def store_in_page_cache(connection, user_id, components, pattern, now):
     """
     Store generated components in page_cache
+    Does NOT commit: the caller's update_job_status commit covers both
+    statements, so the cache row and the job's completion land atomically
+    (and one fsync instead of two per job)
     Returns: cache_id
     """
     cache_id = str(uuid4())
@@ -341,53 +766,46 @@ def store_in_page_cache(connection, user_id, components, pattern):
     relevance_score = pattern.get('confidence', 0.7)
 
     # Set validity (30 minutes from now)
-    valid_until = datetime.now() + timedelta(minutes=30)
+    valid_until = now + timedelta(minutes=30)
 
     with connection.cursor() as cursor:
-        try:
-            cursor.execute("""
-                INSERT INTO page_cache (
-                    id, user_id, cache_key, cache_type, query,
-                    components, relevance_score, valid_until, created_at
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, NOW()
-                )
-            """, (
-                cache_id,
-                user_id,
-                cache_key,
-                'prediction',
-                predicted_query,
-                json.dumps(components),
-                relevance_score,
-                valid_until
-            ))
-            connection.commit()
+        # Single upsert folds the old IntegrityError retry path (and its
+        # extra round-trip) into one statement
+        cursor.execute("""
+            INSERT INTO page_cache (
+                id, user_id, cache_key, cache_type, query,
+                components, relevance_score, valid_until, created_at
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s, %s, %s, %s
+            )
+            ON DUPLICATE KEY UPDATE
+                components = VALUES(components),
+                relevance_score = VALUES(relevance_score),
+                valid_until = VALUES(valid_until),
+                created_at = VALUES(created_at)
+        """, (
+            cache_id,
+            user_id,
+            cache_key,
+            'prediction',
+            predicted_query,
+            jdumps(components),
+            relevance_score,
+            valid_until,
+            now
+        ))
+        # rowcount is 1 for a fresh insert, 2 when an existing row was updated
+        inserted = cursor.rowcount == 1
+
+        if inserted:
             logger.info(f"Stored in page_cache: {cache_id}")
             return cache_id
 
-        except pymysql.IntegrityError as e:
-            # Duplicate cache_key - update existing
-            logger.info(f"Cache key already exists, updating: {cache_key}")
-            cursor.execute("""
-                UPDATE page_cache
-                SET components = %s,
-                    relevance_score = %s,
-                    valid_until = %s,
-                    created_at = NOW()
-                WHERE user_id = %s AND cache_key = %s
-            """, (
-                json.dumps(components),
-                relevance_score,
-                valid_until,
-                user_id,
-                cache_key
-            ))
-            connection.commit()
-            return cache_key
-
-
-def update_job_status(connection, job_id, status, result_cache_key=None):
+        logger.info(f"Cache key already existed, updated: {cache_key}")
+        return cache_key
+
+
+def update_job_status(connection, job_id, status, now, result_cache_key=None):
     """Update generation_queue job status"""
     with connection.cursor() as cursor:
         if result_cache_key:
@@ -395,16 +813,16 @@ def update_job_status(connection, job_id, status, result_cache_key=None):
                 UPDATE generation_queue
                 SET status = %s,
                     result_cache_key = %s,
-                    completed_at = NOW()
+                    completed_at = %s
                 WHERE id = %s
-            """, (status, result_cache_key, job_id))
+            """, (status, result_cache_key, now, job_id))
         elif status == 'processing':
             cursor.execute("""
                 UPDATE generation_queue
                 SET status = %s,
-                    started_at = NOW()
+                    started_at = %s
                 WHERE id = %s
-            """, (status, job_id))
+            """, (status, now, job_id))
         else:
             cursor.execute("""
                 UPDATE generation_queue
@@ -414,7 +832,7 @@ def update_job_status(connection, job_id, status, result_cache_key=None):
         connection.commit()
 
 
-def handle_job_failure(connection, job, error_message):
+def handle_job_failure(connection, job, error_message, now):
     """Handle job failure with retry logic"""
     job_id = job['id']
     attempts = job.get('attempts', 0) + 1
@@ -428,9 +846,9 @@ def handle_job_failure(connection, job, error_message):
                 SET status = 'failed',
                     attempts = %s,
                     error_message = %s,
-                    completed_at = NOW()
+                    completed_at = %s
                 WHERE id = %s
-            """, (attempts, error_message[:500], job_id))
+            """, (attempts, error_message[:500], now, job_id))
         else:
             # Increment attempts and requeue
             logger.warning(f"Job {job_id} attempt {attempts} failed, requeuing: {error_message}")
@@ -445,9 +863,13 @@ def handle_job_failure(connection, job, error_message):
 
 
 def generate_cache_key(user_id, query):
-    """Generate cache key (same algorithm as backend)"""
-    import hashlib
+    """
+    Generate cache key (same algorithm as backend)
+    BLAKE2b is faster than MD5 and not rejected on FIPS-mode hosts; the
+    full-length digest matches Node's crypto 'blake2b512' so the backend
+    can produce identical keys
+    """
     normalized_query = query.lower().strip()
     hash_input = f"{user_id}:{normalized_query}"
-    hash_value = hashlib.md5(hash_input.encode()).hexdigest()
+    hash_value = hashlib.blake2b(hash_input.encode()).hexdigest()
     return hash_value[:16]
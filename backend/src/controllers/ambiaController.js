@@ -205,8 +205,10 @@ exports.getPreferences = async (req, res) => {
  * Generate a cache key for a user query
  */
 function generateCacheKey(userId, userQuery) {
+  // blake2b512 matches Python's hashlib.blake2b() in the Lambda workers —
+  // the two sides must generate identical keys for page_cache hits
   const normalizedQuery = userQuery.toLowerCase().trim();
-  const hash = crypto.createHash('md5').update(`${userId}:${normalizedQuery}`).digest('hex');
+  const hash = crypto.createHash('blake2b512').update(`${userId}:${normalizedQuery}`).digest('hex');
   return hash.substring(0, 16);
 }
 
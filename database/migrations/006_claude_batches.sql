@@ -0,0 +1,31 @@
+-- Ambia Database Schema (MySQL)
+-- Migration 006: Claude Message Batch tracking
+-- Tracks Anthropic Message Batches submitted by the Lambda workers so a
+-- later tick can retrieve and store their results
+
+USE ambia;
+
+-- Claude batches table (one row per submitted Message Batch)
+CREATE TABLE IF NOT EXISTS claude_batches (
+    id VARCHAR(64) PRIMARY KEY, -- Anthropic batch id (msgbatch_...)
+
+    -- Which Lambda submitted the batch
+    source VARCHAR(50) NOT NULL, -- 'ambient_event_detector' | 'claude_generator'
+
+    -- How many requests the batch contains
+    request_count INT NOT NULL DEFAULT 0,
+
+    -- Batch lifecycle
+    status VARCHAR(20) NOT NULL CHECK (status IN (
+        'submitted',  -- Waiting for Anthropic to finish processing
+        'collected',  -- Results retrieved and stored
+        'failed'      -- Batch-level failure
+    )) DEFAULT 'submitted',
+
+    -- Timestamps
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    collected_at TIMESTAMP NULL,
+
+    -- Indexes for efficient querying
+    INDEX idx_claude_batches_pending (source, status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
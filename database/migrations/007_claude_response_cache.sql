@@ -0,0 +1,22 @@
+-- Ambia Database Schema (MySQL)
+-- Migration 007: Claude response cache
+-- Memoizes ambient event detection results keyed by a hash of the user
+-- context, so an unchanged context doesn't pay for a second Claude call
+
+USE ambia;
+
+-- Claude response cache table (one row per distinct user context)
+CREATE TABLE IF NOT EXISTS claude_response_cache (
+    ctx_hash CHAR(32) PRIMARY KEY, -- BLAKE2b-128 of the stable context fields
+    user_id CHAR(36) NOT NULL,
+
+    -- Cached Claude output (list of detected events)
+    response JSON NOT NULL,
+
+    -- Timestamps (freshness is enforced at read time, not stored as TTL)
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    -- Indexes for efficient querying and cleanup
+    INDEX idx_response_cache_user (user_id),
+    INDEX idx_response_cache_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,30 @@
+-- Ambia Database Schema (MySQL)
+-- Migration 008: Covering indexes for the Lambda workers' hot SELECTs
+-- Removes filesorts and full range scans from the queries the scheduled
+-- lambdas run every 1-2 minutes. Verify each plan with EXPLAIN: the hot
+-- queries should show "Using index condition" and no "Using filesort".
+
+USE ambia;
+
+-- ambient_event_detector: get_active_users filters device_tokens on
+-- (notifications_enabled, last_seen_at); the existing idx_device_tokens_active
+-- leads with user_id and can't serve this predicate
+CREATE INDEX idx_device_tokens_enabled_seen
+    ON device_tokens (notifications_enabled, last_seen_at, user_id);
+
+-- ambient_event_detector: fetch_user_contexts ranks ambient_events by
+-- created_at within (user_id, status, valid_until); the existing
+-- idx_ambient_events_active puts event_type before valid_until, breaking the
+-- range scan
+CREATE INDEX idx_ambient_events_user_status_valid
+    ON ambient_events (user_id, status, valid_until, created_at DESC);
+
+-- claude_generator: get_pending_jobs orders ready jobs by priority then
+-- scheduled_for; existing single-purpose indexes (idx_status, idx_priority)
+-- each cover only half the predicate and force a filesort on the other
+CREATE INDEX idx_queue_ready
+    ON generation_queue (status, priority DESC, scheduled_for ASC, valid_until);
+
+-- activity_log already has idx_user_activity (user_id, timestamp DESC) from
+-- backend migration 004, which serves the per-user context fetches; no new
+-- index needed there
@@ -0,0 +1,10 @@
+-- Ambia Database Schema (MySQL)
+-- Migration 009: (withdrawn, intentional no-op)
+-- This migration originally added a timestamp index for activity_log's
+-- recency scans, but 002_ambient_events.sql already creates
+-- idx_activity_log_timestamp (timestamp DESC) on this table — re-creating
+-- it aborted fresh installs with ER_DUP_KEYNAME, and on MySQL 8 the DESC
+-- index already serves a bare timestamp range via backward scan.
+-- Kept as a no-op so the applied migration sequence stays contiguous.
+
+USE ambia;
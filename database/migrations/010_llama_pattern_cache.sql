@@ -0,0 +1,22 @@
+-- Ambia Database Schema (MySQL)
+-- Migration 010: Llama pattern-detection cache
+-- Memoizes prediction_scheduler's Llama results keyed by a hash of the
+-- user's 30-day activity window, so an unchanged window doesn't pay for a
+-- second inference call (same idea as claude_response_cache in 007)
+
+USE ambia;
+
+-- Llama pattern cache table (one row per user, latest analysis only)
+CREATE TABLE IF NOT EXISTS llama_pattern_cache (
+    user_id CHAR(36) PRIMARY KEY,
+    activity_hash CHAR(32) NOT NULL, -- BLAKE2b-128 of the activity window
+
+    -- Cached Llama output (list of detected patterns)
+    patterns_json JSON NOT NULL,
+
+    -- Timestamps (freshness is enforced at read time, not stored as TTL)
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    -- Index for cleanup of stale rows
+    INDEX idx_pattern_cache_computed (computed_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;